@@ -4,9 +4,12 @@ import glob
 import time
 import sys
 import mimetypes
-import base64
 import json
 import tempfile
+import hashlib
+import hmac
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Python 3.9 compatibility patch
 if sys.version_info < (3, 10):
@@ -17,16 +20,37 @@ if sys.version_info < (3, 10):
     except ImportError:
         pass
 
-from flask import Flask, render_template, request, jsonify, url_for
+from flask import Flask, render_template, request, jsonify, url_for, send_from_directory
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
-from PIL import Image
+from PIL import Image, ImageChops, ImageOps
 import io
 
+from history import HistoryStore, PRIVATE_COLUMNS as PRIVATE_HISTORY_COLUMNS
+from genai_replay import ReplayClient
+from client_pool import ClientPool, Endpoint
+import profiling
+from profiling import profiled
+
 # Load environment variables
 load_dotenv()
 
+def load_json_env(name, default):
+    """Parses a JSON environment variable, falling back to default if it is missing or malformed."""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        value = json.loads(raw)
+    except ValueError as e:
+        print(f"❌ Ignoring {name}: invalid JSON ({e})")
+        return default
+    if not isinstance(value, type(default)):
+        print(f"❌ Ignoring {name}: expected a JSON {'object' if isinstance(default, dict) else 'array'}")
+        return default
+    return value
+
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['GENERATED_FOLDER'] = 'static/generated'
@@ -76,6 +100,41 @@ if client is None and GOOGLE_API_KEY:
     except Exception as e:
         print(f"❌ Failed to initialize API Client: {e}")
 
+# Optional pool of several projects/locations (and API keys) to raise aggregate quota, e.g.
+# GENAI_ENDPOINTS='[{"project": "p1", "location": "us-central1", "weight": 2}, {"project": "p2", "location": "europe-west4"}, {"api_key": "...", "weight": 0.5}]'
+GENAI_ENDPOINTS = load_json_env('GENAI_ENDPOINTS', [])
+if GENAI_ENDPOINTS:
+    pool_endpoints = []
+    for config in GENAI_ENDPOINTS:
+        if not isinstance(config, dict):
+            print(f"❌ Ignoring GENAI_ENDPOINTS entry {config!r}: expected a JSON object")
+            continue
+        try:
+            if config.get('api_key'):
+                endpoint_client = genai.Client(api_key=config['api_key'])
+                name = config.get('name', f"api-key-{len(pool_endpoints)}")
+            else:
+                location = config.get('location', GOOGLE_CLOUD_LOCATION)
+                endpoint_client = genai.Client(vertexai=True, project=config['project'], location=location)
+                name = config.get('name', f"{config['project']}/{location}")
+            pool_endpoints.append(Endpoint(name, endpoint_client, config.get('weight', 1)))
+        except Exception as e:
+            print(f"❌ Failed to initialize pool endpoint {config.get('name') or config.get('project')}: {e}")
+    if pool_endpoints:
+        client = ClientPool(pool_endpoints)
+        print(f"✅ Using client pool with {len(pool_endpoints)} endpoints: {', '.join(e.name for e in pool_endpoints)}")
+
+# Record/replay GenAI calls for deterministic benchmarks (GENAI_REPLAY_MODE: off, record, replay)
+GENAI_REPLAY_MODE = os.getenv('GENAI_REPLAY_MODE', 'off').lower()
+GENAI_REPLAY_DIR = os.getenv('GENAI_REPLAY_DIR', 'replay_corpus')
+GENAI_REPLAY_LATENCY_SCALE = float(os.getenv('GENAI_REPLAY_LATENCY_SCALE', '1.0'))
+if GENAI_REPLAY_MODE in ('record', 'replay'):
+    try:
+        client = ReplayClient(client, GENAI_REPLAY_MODE, GENAI_REPLAY_DIR, GENAI_REPLAY_LATENCY_SCALE)
+        print(f"🎞️  GenAI calls in {GENAI_REPLAY_MODE} mode ({GENAI_REPLAY_DIR})")
+    except Exception as e:
+        print(f"❌ Failed to enable GenAI {GENAI_REPLAY_MODE} mode: {e}")
+
 if client is None:
     print("❌ No valid credentials found!")
     print("   Please set either:")
@@ -83,13 +142,114 @@ if client is None:
     print("   - GOOGLE_CLOUD_PROJECT + GOOGLE_APPLICATION_CREDENTIALS (for Vertex AI locally)")
     print("   - GOOGLE_API_KEY (for Gemini API)")
 
+# Street-region crop-and-composite settings
+# STREET_REGION_MODE: 'off' (send full frame), 'band' (fixed horizon band) or 'auto' (edge heuristic)
+STREET_REGION_MODE = os.getenv('STREET_REGION_MODE', 'off').lower()
+STREET_HORIZON_FRACTION = float(os.getenv('STREET_HORIZON_FRACTION', '0.45'))
+STREET_REGION_MARGIN = float(os.getenv('STREET_REGION_MARGIN', '0.05'))
+
+# Tiled processing for panoramas and very high-resolution captures
+# TILE_MODE: 'off', 'auto' (tile when the long edge exceeds TILE_THRESHOLD) or 'on'
+TILE_MODE = os.getenv('TILE_MODE', 'auto').lower()
+TILE_THRESHOLD = int(os.getenv('TILE_THRESHOLD', '4096'))
+TILE_SIZE = int(os.getenv('TILE_SIZE', '2048'))
+TILE_OVERLAP = int(os.getenv('TILE_OVERLAP', '128'))
+TILE_CONCURRENCY = int(os.getenv('TILE_CONCURRENCY', '4'))
+
+IMAGE_MODEL = 'gemini-3-pro-image-preview'
+
+# Request deadlines (seconds). ENDPOINT_DEADLINES / MODEL_DEADLINES are JSON objects,
+# e.g. ENDPOINT_DEADLINES='{"transform": 100, "batch": 300}' MODEL_DEADLINES='{"gemini-2.0-flash-exp": 60}'
+# The Procfile starts gunicorn with --timeout 150. Keep every web endpoint's deadline
+# below that, with some slack, so requests get a clean 504 before gunicorn kills the
+# worker. If you raise a deadline, raise the gunicorn timeout too. Batch runs outside
+# gunicorn, so it is not affected.
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '120'))
+ENDPOINT_DEADLINES = load_json_env('ENDPOINT_DEADLINES', {})
+MODEL_DEADLINES = load_json_env('MODEL_DEADLINES', {})
+DEADLINE_MISSES = {}
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its time budget."""
+
+    def __init__(self, endpoint, stage):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.endpoint = endpoint
+        self.stage = stage
+
+class Deadline:
+    """
+    Time budget for one request, shared by preprocessing, queueing and model calls.
+    The clock starts at `started` (e.g. the load balancer's X-Request-Start) when given.
+    """
+
+    def __init__(self, endpoint, started=None):
+        self.endpoint = endpoint
+        self.budget = float(ENDPOINT_DEADLINES.get(endpoint, REQUEST_DEADLINE_SECONDS))
+        self.expires_at = (started if started is not None else time.time()) + self.budget
+
+    def remaining(self):
+        return self.expires_at - time.time()
+
+    def check(self, stage):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(self.endpoint, stage)
+
+    def model_timeout(self, model):
+        """Returns the HTTP timeout (seconds) for a model call: what is left, capped per model."""
+        self.check(f"{model} call")
+        return min(self.remaining(), float(MODEL_DEADLINES.get(model, self.remaining())))
+
+    def http_options(self, model):
+        """SDK HTTP options carrying this deadline as a timeout (the SDK expects milliseconds)."""
+        return types.HttpOptions(timeout=max(int(self.model_timeout(model) * 1000), 1))
+
+def record_deadline_miss(error):
+    """Counts a deadline miss per endpoint and stage."""
+    key = f"{error.endpoint}:{error.stage}"
+    DEADLINE_MISSES[key] = DEADLINE_MISSES.get(key, 0) + 1
+    print(f"⏱️  {error} ({error.endpoint})")
+
+def request_start_time():
+    """
+    Parses the X-Request-Start header set by some proxies so queueing time counts
+    against the budget. Accepts seconds, milliseconds or microseconds, with an optional 't='.
+    """
+    header = request.headers.get('X-Request-Start', '').replace('t=', '').strip()
+    try:
+        value = float(header)
+    except ValueError:
+        return None
+    # Normalize by magnitude: microseconds > milliseconds > seconds since the epoch
+    while value > 1e11:
+        value /= 1000
+    # Ignore clock skew that would put the start in the future or implausibly far back
+    if not time.time() - 600 < value <= time.time():
+        return None
+    return value
+
+# Transformation history (SQLite, written off the request path)
+HISTORY_DB_PATH = os.getenv('HISTORY_DB_PATH', 'history.db')
+history_store = HistoryStore(HISTORY_DB_PATH)
+
+# Limits advertised to the browser so it can downscale and compress before uploading
+UPLOAD_MAX_EDGE = int(os.getenv('UPLOAD_MAX_EDGE', '3072'))
+UPLOAD_FORMAT = os.getenv('UPLOAD_FORMAT', 'image/webp')
+UPLOAD_QUALITY = float(os.getenv('UPLOAD_QUALITY', '0.9'))
+
+# Token required by the /api/admin endpoints (disabled when unset)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
 # Cache for knowledge base summary
 KNOWLEDGE_CONTEXT_CACHE = None
 
+@profiled('knowledge_base')
 def get_knowledge_context():
     """
     Analyzes all files in the knowledge_base folder using Gemini 1.5 Flash.
     Returns a summarized text of design principles.
+    Not called while the knowledge base is disabled (see resolve_design_prompt),
+    so no 'knowledge_base' profiles are produced until it is re-enabled.
     """
     global KNOWLEDGE_CONTEXT_CACHE
     if KNOWLEDGE_CONTEXT_CACHE is not None:
@@ -191,47 +351,277 @@ def get_knowledge_context():
         print(f"Error analyzing knowledge base: {e}")
         return ""
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def estimate_horizon(image):
+    """
+    Estimates the row (as a fraction of height) where street level begins.
+    Facades produce dense vertical edges while the road surface is smoother,
+    so we scan upwards from the bottom until edge energy stays well above the
+    road's baseline.
+    """
+    small = image.convert('L').resize((64, 96))
+    width, height = small.size
+    pixels = small.load()
 
-@app.route('/api/transform', methods=['POST'])
-def transform_image():
-    if 'image' not in request.files:
-        return jsonify({'error': 'No image uploaded'}), 400
-    if not client:
-        return jsonify({'error': 'Backend API Client not initialized. Check server logs.'}), 500
-    
-    file = request.files['image']
-    custom_prompt = request.form.get('custom_prompt')
-    
-    if not file or file.filename == '':
-        return jsonify({'error': 'Invalid file'}), 400
+    row_energy = []
+    for y in range(height):
+        energy = sum(abs(pixels[x + 1, y] - pixels[x, y]) for x in range(width - 1))
+        row_energy.append(energy / (width - 1))
+
+    # Baseline taken from the bottom quarter, which is almost always road surface
+    road_rows = sorted(row_energy[height * 3 // 4:])
+    baseline = max(road_rows[len(road_rows) // 2], 1)
+
+    horizon_row = None
+    for y in range(height * 3 // 4, 3, -1):
+        if all(energy > baseline * 2 for energy in row_energy[y - 4:y]):
+            horizon_row = y - 4
+            break
+
+    if horizon_row is None:
+        return STREET_HORIZON_FRACTION
+    # Clamp so vehicles or clutter near the camera never crop out the street itself
+    return min(max(horizon_row / height, 0.25), 0.6)
+
+def find_street_region(image, mode):
+    """
+    Returns the (left, top, right, bottom) box of the street-level region,
+    including the configured margin, or None if the full frame should be used.
+    """
+    if mode not in ('band', 'auto'):
+        return None
+
+    width, height = image.size
+    horizon = estimate_horizon(image) if mode == 'auto' else STREET_HORIZON_FRACTION
+    top = int(height * max(horizon - STREET_REGION_MARGIN, 0))
+    if top <= 0:
+        return None
+    return (0, top, width, height)
+
+def composite_street_region(original, generated, box):
+    """
+    Pastes the generated street-level crop back onto the original frame.
+    The top margin is feathered so the seam blends into the preserved pixels,
+    while everything above the crop stays identical to the original.
+    """
+    left, top, right, bottom = box
+    crop_size = (right - left, bottom - top)
+    generated = generated.convert(original.mode).resize(crop_size, Image.LANCZOS)
+
+    feather = max(int(original.size[1] * STREET_REGION_MARGIN), 1)
+    feather = min(feather, crop_size[1])
+    mask = Image.new('L', crop_size, 255)
+    for y in range(feather):
+        mask.paste(int(255 * y / feather), (0, y, crop_size[0], y + 1))
+
+    result = original.copy()
+    result.paste(generated, (left, top), mask)
+    return result
+
+def encode_image(image, mime_type):
+    """Encodes a PIL image to bytes in the given mime type."""
+    buffer = io.BytesIO()
+    if mime_type == 'image/png':
+        image.save(buffer, format='PNG')
+    elif mime_type == 'image/webp':
+        image.save(buffer, format='WEBP', quality=92)
+    else:
+        image.convert('RGB').save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+def generate_image(prompt_text, image_bytes, mime_type, deadline=None):
+    """
+    Sends the prompt and reference image to the image model.
+    Returns the generated image bytes, or None if the response had no image.
+    With a deadline, the remaining budget is passed to the SDK as the HTTP timeout
+    and DeadlineExceeded is raised if the call is cut off by it.
+    """
+    transformation_parts = [
+        types.Part.from_text(text=prompt_text),
+        types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+    ]
+
+    config = None
+    if deadline:
+        config = types.GenerateContentConfig(http_options=deadline.http_options(IMAGE_MODEL))
 
-    # Save original image
-    filename = str(uuid.uuid4()) + "_" + file.filename
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
-    
-    # Read and encode the image for inline use (Vertex AI doesn't support File API)
-    print(f"Preparing reference image: {filepath}")
     try:
-        # Detect mime type
-        mime_type, _ = mimetypes.guess_type(filepath)
-        if not mime_type:
-            mime_type = 'image/jpeg'  # default fallback
-        
-        # Read image as bytes and encode to base64
-        with open(filepath, "rb") as f:
-            image_bytes = f.read()
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-        
-        print(f"Image prepared (size: {len(image_bytes)} bytes, mime: {mime_type})")
-        
+        response = client.models.generate_content(
+            model=IMAGE_MODEL,
+            contents=[types.Content(role='user', parts=transformation_parts)],
+            config=config
+        )
     except Exception as e:
-        print(f"Error preparing reference image: {e}")
-        return jsonify({'error': f'Failed to prepare image: {str(e)}'}), 500
-    
+        # The SDK surfaces our timeout as a transport error; report it as a missed deadline
+        timed_out = 'timeout' in type(e).__name__.lower() or 'timed out' in str(e).lower()
+        if deadline and (timed_out or deadline.remaining() <= 0):
+            raise DeadlineExceeded(deadline.endpoint, f"{IMAGE_MODEL} call") from e
+        raise
+
+    # Extract the generated image from response
+    if hasattr(response, 'candidates') and response.candidates:
+        for part in response.candidates[0].content.parts:
+            if hasattr(part, 'inline_data') and part.inline_data:
+                return part.inline_data.data
+    return None
+
+def should_tile(image, tile_mode):
+    """Decides whether an image should go through the tiled path."""
+    if tile_mode == 'on':
+        return max(image.size) > TILE_SIZE
+    if tile_mode == 'auto':
+        return max(image.size) > TILE_THRESHOLD
+    return False
+
+def tile_positions(length):
+    """Returns tile start offsets along one axis, with the last tile flush to the edge."""
+    if length <= TILE_SIZE:
+        return [0]
+    step = max(TILE_SIZE - TILE_OVERLAP, 1)
+    positions = list(range(0, length - TILE_SIZE, step))
+    positions.append(length - TILE_SIZE)
+    return positions
+
+def tile_mask(size, feather_left, feather_top):
+    """
+    Builds the paste mask for a tile: linear ramps over the overlap on the
+    edges that were already covered by a previous tile, opaque elsewhere.
+    """
+    width, height = size
+    mask = Image.new('L', size, 255)
+    if feather_top:
+        ramp = Image.linear_gradient('L').resize((width, TILE_OVERLAP))
+        mask.paste(ramp, (0, 0))
+    if feather_left:
+        ramp = Image.linear_gradient('L').rotate(90, expand=True)
+        ramp = ramp.resize((TILE_OVERLAP, height))
+        left_mask = Image.new('L', size, 255)
+        left_mask.paste(ramp, (0, 0))
+        mask = ImageChops.darker(mask, left_mask)
+    return mask
+
+def generate_tiled_image(prompt_text, image, mime_type, deadline=None):
+    """
+    Splits a large image into overlapping tiles, generates them concurrently
+    and stitches them back with seam blending.
+
+    Tiles are encoded only when submitted and pasted in raster order as soon
+    as they are ready, so at most TILE_CONCURRENCY tiles are held in memory.
+    Returns (image_bytes, stats) or (None, stats) if any tile failed; no further
+    tiles are submitted after a failure.
+    """
+    started = time.time()
+    width, height = image.size
+    boxes = [
+        (x, y, min(x + TILE_SIZE, width), min(y + TILE_SIZE, height))
+        for y in tile_positions(height)
+        for x in tile_positions(width)
+    ]
+    print(f"Tiling {width}x{height} image into {len(boxes)} tiles (concurrency {TILE_CONCURRENCY})")
+
+    tile_prompt = prompt_text + "\n\nNOTE: This image is one tile of a larger panorama. Do not add borders, keep the edges continuous and return an image of the same size and framing."
+
+    def run_tile(box):
+        tile_started = time.time()
+        if deadline:
+            deadline.check("tile queue")
+        tile_bytes = encode_image(image.crop(box), mime_type)
+        data = generate_image(tile_prompt, tile_bytes, mime_type, deadline)
+        return data, time.time() - tile_started
+
+    canvas = image.copy()
+    tile_latencies = []
+    failed = False
+
+    def paste_tile(box, future):
+        """Pastes a finished tile; returns False if the model produced no image."""
+        data, latency = future.result()
+        tile_latencies.append(round(latency, 3))
+        if not data:
+            return False
+        tile = Image.open(io.BytesIO(data)).convert(canvas.mode)
+        tile = tile.resize((box[2] - box[0], box[3] - box[1]), Image.LANCZOS)
+        canvas.paste(tile, box[:2], tile_mask(tile.size, box[0] > 0, box[1] > 0))
+        return True
+
+    executor = ThreadPoolExecutor(max_workers=TILE_CONCURRENCY)
+    try:
+        pending = deque()
+        for box in boxes:
+            if len(pending) >= TILE_CONCURRENCY and not paste_tile(*pending.popleft()):
+                failed = True
+                break
+            pending.append((box, executor.submit(profiling.follow(run_tile), box)))
+        while pending and not failed:
+            failed = not paste_tile(*pending.popleft())
+    finally:
+        # On failure (a missing tile or a missed deadline) stop instead of spending quota on the rest
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    stats = {
+        'tile_count': len(boxes),
+        'tile_latencies': tile_latencies,
+        'wall_time': round(time.time() - started, 3)
+    }
+    print(f"Tiled generation finished: {stats['tile_count']} tiles in {stats['wall_time']}s")
+
+    if failed:
+        return None, stats
+    return encode_image(canvas, mime_type), stats
+
+def prepare_source_image(image_bytes, mime_type, region_mode, tile_mode):
+    """
+    Works out what will be sent to the model for an uploaded image.
+    Returns a dict with the (possibly cropped) bytes, the decoded images and
+    the street region / tiling decisions needed to rebuild the final result.
+    """
+    # Decode only when a mode needs pixel access (Image.open reads just the header)
+    original_image = None
+    source_image = None
+    street_box = None
+    use_tiles = False
+    if region_mode in ('band', 'auto') or tile_mode == 'on':
+        original_image = Image.open(io.BytesIO(image_bytes))
+        use_tiles = should_tile(original_image, tile_mode)
+    elif tile_mode == 'auto':
+        # Auto tiling is only a size check; formats Pillow can't read (e.g. HEIC) go to the model untouched
+        try:
+            original_image = Image.open(io.BytesIO(image_bytes))
+            use_tiles = should_tile(original_image, tile_mode)
+        except OSError as e:
+            print(f"⚠️  Could not decode image for tiling, sending it as is: {e}")
+            original_image = None
+
+    if region_mode in ('band', 'auto') or use_tiles:
+        # Apply the EXIF orientation first so "bottom band" and tile rows follow the upright photo
+        original_image = ImageOps.exif_transpose(original_image)
+        if original_image.mode not in ('RGB', 'RGBA', 'L'):
+            original_image = original_image.convert('RGB')
+        source_image = original_image
+
+    # Optionally send only the street-level crop; the rest is restored from the original
+    if region_mode in ('band', 'auto'):
+        street_box = find_street_region(original_image, region_mode)
+        if street_box:
+            source_image = original_image.crop(street_box)
+            image_bytes = encode_image(source_image, mime_type)
+            print(f"Street region {street_box} ({region_mode}), crop size: {len(image_bytes)} bytes")
+
+    return {
+        'image_bytes': image_bytes,
+        'mime_type': mime_type,
+        'original_image': original_image,
+        'source_image': source_image,
+        'street_box': street_box,
+        'use_tiles': use_tiles
+    }
+
+def resolve_design_prompt(custom_prompt):
+    """
+    Resolves the user's prompt against the design libraries.
+    Returns (full_prompt, negative_prompt); negative_prompt is None for free-form prompts.
+    """
     # Get Knowledge context (temporarily disabled for Vertex AI compatibility)
     # knowledge_context = get_knowledge_context()
     knowledge_context = ""
@@ -299,16 +689,13 @@ def transform_image():
         - Natural lighting, realistic shadows and textures.
         - The perspective must match the original image exactly.
         """
-    
-    print(f"Generating with prompt:\n{full_prompt}")
 
-    try:
-        # Use Gemini 3 Pro Image Preview for TRUE image-to-image transformation
-        # This model accepts the input image and generates a modified version
-        print(f"Transforming image with gemini-3-pro-image-preview (TRUE image-to-image)...")
-        
-        # Build the prompt with both text instruction and reference image
-        prompt_text = f"""Transform this street view image with the following changes:
+    return full_prompt, negative_prompt
+
+def build_transformation_prompt(full_prompt, negative_prompt, street_box=None):
+    """Wraps the resolved design prompt with the image-to-image preservation rules."""
+    # Build the prompt with both text instruction and reference image
+    prompt_text = f"""Transform this street view image with the following changes:
 
 {full_prompt}
 
@@ -322,46 +709,306 @@ CRITICAL INSTRUCTIONS:
 
 The result should look like the same street, same buildings, same view - just with the requested street changes applied."""
 
-        if negative_prompt:
-            prompt_text += f"\n\nDO NOT include: {negative_prompt}"
+    if negative_prompt:
+        prompt_text += f"\n\nDO NOT include: {negative_prompt}"
+
+    if street_box:
+        prompt_text += "\n\nNOTE: This image is the street-level crop of a larger photo. Keep its edges continuous with the surroundings and return an image of the same size and framing."
+
+    return prompt_text
+
+def run_transformation(source, prompt_text, timings=None, deadline=None):
+    """
+    Generates the transformed image for a prepared source (see prepare_source_image).
+    Returns (image_bytes, tiling_stats); image_bytes is None if nothing was generated.
+    If a timings dict is given, 'generate' and 'composite' stage durations are added to it.
+    Street-region composites are encoded as PNG so the preserved pixels survive unchanged;
+    source['output_mime_type'] is set when that happens.
+    """
+    if timings is None:
+        timings = {}
+    stage_started = time.time()
+
+    # Use Gemini 3 Pro Image Preview for TRUE image-to-image transformation
+    # This model accepts the input image and generates a modified version
+    print(f"Transforming image with {IMAGE_MODEL} (TRUE image-to-image)...")
+
+    mime_type = source['mime_type']
+    tiling_stats = None
+    if source['use_tiles']:
+        generated_image_data, tiling_stats = generate_tiled_image(prompt_text, source['source_image'], mime_type, deadline)
+    else:
+        generated_image_data = generate_image(prompt_text, source['image_bytes'], mime_type, deadline)
+
+    timings['generate'] = round(time.time() - stage_started, 3)
+    print(f"Image transformation complete!")
+
+    if generated_image_data and source['street_box']:
+        if deadline:
+            deadline.check("composite")
+        stage_started = time.time()
+        generated_crop = Image.open(io.BytesIO(generated_image_data))
+        composited = composite_street_region(source['original_image'], generated_crop, source['street_box'])
+        generated_image_data = encode_image(composited, 'image/png')
+        source['output_mime_type'] = 'image/png'
+        timings['composite'] = round(time.time() - stage_started, 3)
+
+    return generated_image_data, tiling_stats
+
+class ImagePreparationError(Exception):
+    """Raised when an uploaded image cannot be decoded or prepared for the model."""
+
+def transform_image_bytes(image_bytes, mime_type, custom_prompt, region_mode=None, tile_mode=None,
+                          deadline=None, timings=None):
+    """
+    Runs the full transform pipeline used by /api/transform and the batch CLI on raw image bytes.
+    Returns (image_bytes, info) where info holds the street region, tiling stats,
+    stage timings, the resolved prompt hash and output_mime_type (None when the output
+    keeps the input's format, 'image/png' for lossless street-region composites).
+    Stage timings are also written into `timings` when given, so callers keep them on failure.
+    Raises ImagePreparationError for unusable images and DeadlineExceeded if the deadline runs out.
+    """
+    region_mode = (region_mode or STREET_REGION_MODE).lower()
+    tile_mode = (tile_mode or TILE_MODE).lower()
+    if timings is None:
+        timings = {}
+
+    stage_started = time.time()
+    try:
+        source = prepare_source_image(image_bytes, mime_type, region_mode, tile_mode)
+    except Exception as e:
+        raise ImagePreparationError(str(e)) from e
+    timings['prepare'] = round(time.time() - stage_started, 3)
+    if deadline:
+        deadline.check("preprocessing")
+
+    stage_started = time.time()
+    full_prompt, negative_prompt = resolve_design_prompt(custom_prompt)
+    print(f"Generating with prompt:\n{full_prompt}")
+    prompt_text = build_transformation_prompt(full_prompt, negative_prompt, source['street_box'])
+    timings['prompt'] = round(time.time() - stage_started, 3)
+
+    generated_image_data, tiling_stats = run_transformation(source, prompt_text, timings, deadline)
+
+    return generated_image_data, {
+        'street_region': list(source['street_box']) if source['street_box'] else None,
+        'tiling': tiling_stats,
+        'timings': timings,
+        'prompt_hash': hashlib.sha256(prompt_text.encode('utf-8')).hexdigest(),
+        'output_mime_type': source.get('output_mime_type')
+    }
+
+def output_filename(filename, output_mime_type):
+    """Swaps the extension when the output format differs from the upload's."""
+    if not output_mime_type:
+        return filename
+    extension = mimetypes.guess_extension(output_mime_type) or ''
+    return os.path.splitext(filename)[0] + extension
+
+def record_history(history, timings, request_started, status, error=None):
+    """Queues a transformation history row; the write happens on a background thread."""
+    history_store.record(
+        status=status,
+        timings=timings,
+        total_time=round(time.time() - request_started, 3),
+        error=error,
+        **history
+    )
+
+def deadline_response(error, history, timings, request_started):
+    """Counts the miss, records it and returns a 504 the client can recognise."""
+    record_deadline_miss(error)
+    record_history(history, timings, request_started, 'timeout', error=str(error))
+    return jsonify({
+        'error': f"Request timed out: the server could not finish within {ENDPOINT_DEADLINES.get(error.endpoint, REQUEST_DEADLINE_SECONDS):g}s. Please try again.",
+        'timeout': True,
+        'stage': error.stage
+    }), 504
+
+def client_request_timeout_ms():
+    # The browser waits slightly longer than the server budget so it sees our 504 rather than its own abort
+    return int((float(ENDPOINT_DEADLINES.get('transform', REQUEST_DEADLINE_SECONDS)) + 10) * 1000)
+
+@app.route('/')
+def index():
+    return render_template('index.html', request_timeout_ms=client_request_timeout_ms())
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+@app.route('/api/admin/profiles')
+def admin_profiles():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    return jsonify({
+        'enabled': profiling.PROFILING_ENABLED,
+        'sample_rate': profiling.PROFILE_SAMPLE_RATE,
+        'profiles': profiling.list_profiles(limit)
+    })
+
+@app.route('/api/admin/profiles/<path:name>')
+def admin_profile_download(name):
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return send_from_directory(os.path.abspath(profiling.PROFILE_DIR), name, mimetype='text/plain')
+
+@app.route('/api/metrics')
+def metrics():
+    result = {'deadline_misses': DEADLINE_MISSES}
+    pool = client.inner if isinstance(client, ReplayClient) else client
+    # Pool stats name projects and echo upstream errors, so only admins see them
+    if isinstance(pool, ClientPool) and is_admin_request():
+        result['client_pool'] = pool.stats()
+    return jsonify(result)
+
+@app.route('/api/config')
+def client_config():
+    """
+    Upload preferences for the browser; max_edge 0 means send the original file.
+    Images whose long edge exceeds keep_original_above would be tiled here, so they
+    are sent at full resolution instead of being downscaled below the tiling size.
+    """
+    tiling_edge = {'auto': TILE_THRESHOLD, 'on': TILE_SIZE}.get(TILE_MODE, 0)
+    return jsonify({
+        'upload': {
+            'max_edge': UPLOAD_MAX_EDGE,
+            'keep_original_above': tiling_edge,
+            'format': UPLOAD_FORMAT,
+            'fallback_format': 'image/jpeg',
+            'quality': UPLOAD_QUALITY
+        },
+        'request_timeout_ms': client_request_timeout_ms()
+    })
+
+@app.route('/api/transform', methods=['POST'])
+@profiled('transform')
+def transform_image():
+    if 'image' not in request.files:
+        return jsonify({'error': 'No image uploaded'}), 400
+    if not client:
+        return jsonify({'error': 'Backend API Client not initialized. Check server logs.'}), 500
+    
+    file = request.files['image']
+    custom_prompt = request.form.get('custom_prompt')
+    region_mode = (request.form.get('region_mode') or STREET_REGION_MODE).lower()
+    tile_mode = (request.form.get('tile_mode') or TILE_MODE).lower()
+    
+    if not file or file.filename == '':
+        return jsonify({'error': 'Invalid file'}), 400
+
+    request_started = time.time()
+    deadline = Deadline('transform', request_start_time())
+    timings = {}
+    # Only UI presets are stored as a preset key; free-form text is kept in its own private column
+    is_preset = request.form.get('prompt_type') == 'preset'
+    history = {
+        'input_filename': file.filename,
+        'preset_key': custom_prompt if is_preset else None,
+        'custom_prompt': None if is_preset else custom_prompt,
+        'model': IMAGE_MODEL
+    }
+
+    # Save original image
+    filename = str(uuid.uuid4()) + "_" + file.filename
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(filepath)
+    timings['save_upload'] = round(time.time() - request_started, 3)
+    
+    # Read the image for inline use (Vertex AI doesn't support File API)
+    print(f"Preparing reference image: {filepath}")
+    try:
+        # Detect mime type
+        mime_type, _ = mimetypes.guess_type(filepath)
+        if not mime_type:
+            mime_type = 'image/jpeg'  # default fallback
         
-        transformation_parts = [
-            types.Part.from_text(text=prompt_text),
-            types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-        ]
+        # Read image as bytes
+        with open(filepath, "rb") as f:
+            image_bytes = f.read()
         
-        response = client.models.generate_content(
-            model='gemini-3-pro-image-preview',
-            contents=[types.Content(role='user', parts=transformation_parts)]
+        print(f"Image prepared (size: {len(image_bytes)} bytes, mime: {mime_type})")
+        history['input_hash'] = hashlib.sha256(image_bytes).hexdigest()
+        history['input_bytes'] = len(image_bytes)
+
+        generated_image_data, info = transform_image_bytes(
+            image_bytes, mime_type, custom_prompt,
+            region_mode=region_mode, tile_mode=tile_mode,
+            deadline=deadline, timings=timings
         )
-        
-        print(f"Image transformation complete!")
-        
-        # Extract the generated image from response
-        generated_image_data = None
-        if hasattr(response, 'candidates') and response.candidates:
-            for part in response.candidates[0].content.parts:
-                if hasattr(part, 'inline_data') and part.inline_data:
-                    generated_image_data = part.inline_data.data
-                    break
+        history['prompt_hash'] = info['prompt_hash']
         
         if not generated_image_data:
+            record_history(history, timings, request_started, 'failed', error='No image generated in response')
             return jsonify({'error': 'No image generated in response'}), 500
             
         # Save the generated image
-        generated_filename = "gen_" + filename
+        stage_started = time.time()
+        generated_filename = "gen_" + output_filename(filename, info['output_mime_type'])
         generated_filepath = os.path.join(app.config['GENERATED_FOLDER'], generated_filename)
         with open(generated_filepath, "wb") as f:
             f.write(generated_image_data)
+        timings['save_output'] = round(time.time() - stage_started, 3)
+
+        history['output_path'] = generated_filepath
+        history['output_bytes'] = len(generated_image_data)
+        record_history(history, timings, request_started, 'success')
         
-        return jsonify({
+        result = {
             'status': 'success',
             'image_url': url_for('static', filename=f'generated/{generated_filename}')
-        })
+        }
+        if info['street_region']:
+            result['street_region'] = info['street_region']
+        if info['tiling']:
+            result['tiling'] = info['tiling']
+        return jsonify(result)
 
+    except DeadlineExceeded as e:
+        return deadline_response(e, history, timings, request_started)
+    except (OSError, ImagePreparationError) as e:
+        print(f"Error preparing reference image: {e}")
+        record_history(history, timings, request_started, 'failed', error=str(e))
+        return jsonify({'error': f'Failed to prepare image: {str(e)}'}), 500
     except Exception as e:
         print(f"Error generating image: {e}")
+        record_history(history, timings, request_started, 'failed', error=str(e))
         return jsonify({'error': f"API Error: {str(e)}"}), 500
 
+@app.route('/api/history')
+def transformation_history():
+    """
+    Paginated transformation history, newest first.
+    Query params: limit (max 100), cursor (from the previous page's next_cursor),
+    preset and status filters. Input filenames, free-form prompts, server paths
+    and raw errors are only returned to admin requests.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'limit and cursor must be integers'}), 400
+
+    items, next_cursor = history_store.list(
+        limit=limit,
+        cursor=cursor,
+        preset_key=request.args.get('preset'),
+        status=request.args.get('status')
+    )
+
+    is_admin = is_admin_request()
+    generated_folder = os.path.normpath(app.config['GENERATED_FOLDER'])
+    for item in items:
+        output_path = item.get('output_path')
+        if output_path and os.path.dirname(os.path.normpath(output_path)) == generated_folder:
+            item['image_url'] = url_for('static', filename=f'generated/{os.path.basename(output_path)}')
+        if not is_admin:
+            for column in PRIVATE_HISTORY_COLUMNS:
+                item.pop(column, None)
+
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
 if __name__ == '__main__':
     app.run(debug=True, port=8888)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Batch processor for running whole photo directories through one or more presets.
+
+Uses the same prompt resolution and generation pipeline as /api/transform.
+Progress is appended to a JSONL manifest, so an interrupted run can simply be
+started again and will skip every (image, preset) pair that already succeeded.
+--rate limits model calls rather than jobs, because a tiled image sends one
+generate_content call per tile.
+
+Example:
+    python batch_process.py photos/ --preset "Add bike lanes" --preset "標線型人行道 (Green Sidewalk)" \\
+        --output-dir batch_output --workers 4 --rate 20
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+class RateLimiter:
+    """Spaces calls so no more than `per_minute` begin each minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _RateLimitedModels:
+    def __init__(self, inner, limiter):
+        self._inner = inner
+        self._limiter = limiter
+
+    def generate_content(self, **kwargs):
+        waited = time.time()
+        self._limiter.wait()
+        waited = time.time() - waited
+
+        # Time spent waiting for a slot comes out of the caller's HTTP timeout
+        config = kwargs.get('config')
+        http_options = getattr(config, 'http_options', None)
+        if waited and http_options is not None and http_options.timeout:
+            remaining_ms = int(http_options.timeout - waited * 1000)
+            if remaining_ms <= 0:
+                raise TimeoutError("Deadline ran out while waiting for a rate limit slot")
+            kwargs['config'] = config.model_copy(
+                update={'http_options': http_options.model_copy(update={'timeout': remaining_ms})}
+            )
+        return self._inner.models.generate_content(**kwargs)
+
+
+class RateLimitedClient:
+    """Wraps a genai.Client (or pool / replay client) so every generate_content call goes through a RateLimiter."""
+
+    def __init__(self, inner, limiter):
+        self.inner = inner
+        self.models = _RateLimitedModels(inner, limiter)
+        self.files = inner.files
+
+
+def preset_slug(preset):
+    """Short, filesystem-safe identifier for a preset (keys may contain CJK text)."""
+    ascii_part = ''.join(c if c.isalnum() else '-' for c in preset if c.isascii())
+    ascii_part = '-'.join(filter(None, ascii_part.split('-')))[:40]
+    digest = hashlib.sha1(preset.encode('utf-8')).hexdigest()[:8]
+    return f"{ascii_part}-{digest}" if ascii_part else digest
+
+
+def find_images(input_dir, exclude_dirs=()):
+    """
+    Walks the input directory and returns image paths relative to it, sorted.
+    Directories in exclude_dirs (e.g. the output directory) are not searched.
+    """
+    excluded = {os.path.realpath(d) for d in exclude_dirs}
+    images = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = [d for d in dirs if os.path.realpath(os.path.join(root, d)) not in excluded]
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(images)
+
+
+def load_completed(manifest_path):
+    """Returns the set of (image, preset) pairs recorded as successful in the manifest."""
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if entry.get('status') == 'success':
+                completed.add((entry['image'], entry['preset']))
+    return completed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a directory of street photos through design presets.")
+    parser.add_argument('input_dir', help="Directory of street photos (searched recursively)")
+    parser.add_argument('--preset', action='append', dest='presets',
+                        help="Preset key or free-form prompt; repeat for several presets")
+    parser.add_argument('--output-dir', default='batch_output', help="Where generated images are written")
+    parser.add_argument('--manifest', help="JSONL progress manifest (default: <output-dir>/manifest.jsonl)")
+    parser.add_argument('--workers', type=int, default=4, help="Number of concurrent jobs")
+    parser.add_argument('--rate', type=float, default=0,
+                        help="Maximum model calls per minute, counting each tile (0 = unlimited)")
+    parser.add_argument('--region-mode', help="Street region mode: off, band or auto")
+    parser.add_argument('--tile-mode', help="Tiling mode: off, auto or on")
+    parser.add_argument('--list-presets', action='store_true', help="Print the library preset keys and exit")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Importing app initializes the shared client from the environment
+    import app as street_app
+
+    if args.list_presets:
+        sys.path.append(os.path.join(street_app.app.root_path, 'knowledge_base'))
+        from street_prompt_data_taiwan import TAIWAN_STREET_DESIGN_DICT
+        from street_prompt_data_full import SET_DESIGN_TOOL_DICT
+        for key in list(TAIWAN_STREET_DESIGN_DICT) + list(SET_DESIGN_TOOL_DICT):
+            print(key)
+        return 0
+
+    if not args.presets:
+        print("❌ At least one --preset is required.")
+        return 2
+    if street_app.client is None:
+        print("❌ Backend API Client not initialized. Check your environment variables.")
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output_dir, 'manifest.jsonl')
+
+    images = find_images(args.input_dir, exclude_dirs=[args.output_dir])
+    completed = load_completed(manifest_path)
+    jobs = [(image, preset) for image in images for preset in args.presets
+            if (image, preset) not in completed]
+    skipped = len(images) * len(args.presets) - len(jobs)
+
+    print(f"Found {len(images)} images x {len(args.presets)} presets; "
+          f"{skipped} already done, {len(jobs)} to run with {args.workers} workers")
+
+    if args.rate:
+        street_app.client = RateLimitedClient(street_app.client, RateLimiter(args.rate))
+    manifest_lock = threading.Lock()
+
+    def record(entry):
+        with manifest_lock, open(manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def run_job(image, preset):
+        started = time.time()
+        input_path = os.path.join(args.input_dir, image)
+        # The stem keeps the source extension so a.jpg and a.png can't both become a__<slug>.png
+        ext = os.path.splitext(image)[1]
+        output_path = os.path.join(args.output_dir, f"{image}__{preset_slug(preset)}{ext}")
+        entry = {'image': image, 'preset': preset, 'output': output_path}
+        try:
+            mime_type, _ = mimetypes.guess_type(input_path)
+            with open(input_path, "rb") as f:
+                image_bytes = f.read()
+            data, info = street_app.transform_image_bytes(
+                image_bytes, mime_type or 'image/jpeg', preset,
+                region_mode=args.region_mode, tile_mode=args.tile_mode,
+                deadline=street_app.Deadline('batch')
+            )
+            if not data:
+                raise RuntimeError("No image generated in response")
+            output_path = street_app.output_filename(output_path, info.get('output_mime_type'))
+            entry['output'] = output_path
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "wb") as f:
+                f.write(data)
+            entry.update(status='success', **{k: v for k, v in info.items() if v and k != 'output_mime_type'})
+        except street_app.DeadlineExceeded as e:
+            street_app.record_deadline_miss(e)
+            entry.update(status='timeout', error=str(e))
+        except Exception as e:
+            entry.update(status='failed', error=str(e))
+        entry['elapsed'] = round(time.time() - started, 3)
+        record(entry)
+        return entry
+
+    run_started = time.time()
+    succeeded, failed = 0, []
+    # Threads rather than processes: jobs are I/O bound and share the app's client
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        futures = [executor.submit(run_job, image, preset) for image, preset in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            if entry['status'] == 'success':
+                succeeded += 1
+                print(f"[{done}/{len(jobs)}] ✅ {entry['image']} ({entry['preset']}) in {entry['elapsed']}s")
+            else:
+                failed.append(entry)
+                print(f"[{done}/{len(jobs)}] ❌ {entry['image']} ({entry['preset']}): {entry['error']}")
+        executor.shutdown()
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished jobs are in the manifest and will be skipped on the next run.")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    wall_time = time.time() - run_started
+    throughput = (succeeded / wall_time * 60) if wall_time > 0 else 0
+
+    print("\n" + "=" * 60)
+    print(f"Succeeded: {succeeded}  Failed: {len(failed)}  Skipped (already done): {skipped}")
+    print(f"Wall time: {wall_time:.1f}s  Throughput: {throughput:.2f} images/min")
+    if failed:
+        print("Failures:")
+        for entry in failed:
+            print(f" - {entry['image']} ({entry['preset']}): {entry['error']}")
+    print(f"Manifest: {manifest_path}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
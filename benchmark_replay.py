@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Performance regression benchmark built on recorded GenAI calls.
+
+1. Record a corpus once (spends quota, needs credentials):
+       python benchmark_replay.py record photos/ --preset "Add bike lanes" --region-mode band
+2. Replay it after every change to prompt building, preprocessing or post-processing:
+       python benchmark_replay.py run
+   The first run saves baseline.json; later runs fail (exit 1) when end-to-end
+   or any per-stage time regresses past --threshold. Use --update-baseline to
+   accept new numbers.
+
+Model latency is replayed at --latency-scale times the recorded value (0 by
+default, so only our own code is timed).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import mimetypes
+import statistics
+
+from genai_replay import BlobStore, ReplayClient
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Record or replay the GenAI benchmark corpus.")
+    parser.add_argument('--corpus', default='replay_corpus', help="Replay corpus directory")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    record = sub.add_parser('record', help="Run images through the live model and record the calls")
+    record.add_argument('input_dir', help="Directory of street photos")
+    record.add_argument('--preset', action='append', dest='presets', required=True,
+                        help="Preset key or free-form prompt; repeat for several presets")
+    record.add_argument('--region-mode', help="Street region mode: off, band or auto")
+    record.add_argument('--tile-mode', help="Tiling mode: off, auto or on")
+
+    run = sub.add_parser('run', help="Replay the corpus and compare against the baseline")
+    run.add_argument('--repeat', type=int, default=3, help="Runs per case; the median is used")
+    run.add_argument('--latency-scale', type=float, default=0.0, help="Multiplier for recorded model latency")
+    run.add_argument('--threshold', type=float, default=0.2, help="Allowed relative slowdown (0.2 = 20%%)")
+    run.add_argument('--min-delta', type=float, default=0.005, help="Ignore regressions smaller than this many seconds")
+    run.add_argument('--update-baseline', action='store_true', help="Overwrite baseline.json with this run")
+    return parser.parse_args()
+
+
+def load_cases(corpus):
+    path = os.path.join(corpus, 'cases.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(args, street_app):
+    inner = street_app.client.inner if isinstance(street_app.client, ReplayClient) else street_app.client
+    if inner is None:
+        print("❌ Recording needs a live client. Check your environment variables.")
+        return 1
+    street_app.client = ReplayClient(inner, 'record', args.corpus)
+    blobs = BlobStore(os.path.join(args.corpus, 'blobs'))
+
+    recorded = 0
+    with open(os.path.join(args.corpus, 'cases.jsonl'), "a", encoding="utf-8") as cases:
+        for name in sorted(os.listdir(args.input_dir)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(args.input_dir, name), "rb") as f:
+                image_bytes = f.read()
+            mime_type = mimetypes.guess_type(name)[0] or 'image/jpeg'
+            for preset in args.presets:
+                try:
+                    data, _ = street_app.transform_image_bytes(
+                        image_bytes, mime_type, preset,
+                        region_mode=args.region_mode, tile_mode=args.tile_mode
+                    )
+                    if not data:
+                        raise RuntimeError("No image generated in response")
+                except Exception as e:
+                    print(f"❌ {name} ({preset}): {e}")
+                    continue
+                case = {
+                    'name': f"{name} | {preset}",
+                    'image': blobs.put(image_bytes),
+                    'mime_type': mime_type,
+                    'preset': preset,
+                    'region_mode': args.region_mode,
+                    'tile_mode': args.tile_mode
+                }
+                cases.write(json.dumps(case, ensure_ascii=False) + "\n")
+                recorded += 1
+                print(f"✅ Recorded {case['name']}")
+
+    print(f"Recorded {recorded} cases into {args.corpus}")
+    return 0
+
+
+def measure(args, street_app, cases):
+    """Replays every case and returns {metric: seconds}, summing per-case medians."""
+    street_app.client = ReplayClient(None, 'replay', args.corpus, latency_scale=args.latency_scale)
+    blobs = BlobStore(os.path.join(args.corpus, 'blobs'))
+
+    totals = {}
+    for case in cases:
+        image_bytes = blobs.get(case['image'])
+        samples = {}
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            data, info = street_app.transform_image_bytes(
+                image_bytes, case['mime_type'], case['preset'],
+                region_mode=case.get('region_mode'), tile_mode=case.get('tile_mode')
+            )
+            elapsed = time.perf_counter() - started
+            if not data:
+                raise RuntimeError(f"Replay of {case['name']} produced no image")
+            samples.setdefault('end_to_end', []).append(elapsed)
+            for stage, seconds in info['timings'].items():
+                samples.setdefault(stage, []).append(seconds)
+
+        for metric, values in samples.items():
+            totals[metric] = totals.get(metric, 0) + statistics.median(values)
+        print(f"  {case['name']}: {statistics.median(samples['end_to_end']) * 1000:.1f} ms")
+
+    return {metric: round(seconds, 4) for metric, seconds in totals.items()}
+
+
+def run(args, street_app):
+    cases = load_cases(args.corpus)
+    if not cases:
+        print(f"❌ No recorded cases in {args.corpus}. Run 'record' first.")
+        return 1
+
+    print(f"Replaying {len(cases)} cases x {args.repeat} (latency scale {args.latency_scale})")
+    results = measure(args, street_app, cases)
+
+    baseline_path = os.path.join(args.corpus, 'baseline.json')
+    if args.update_baseline or not os.path.exists(baseline_path):
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {baseline_path}: {results}")
+        return 0
+
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    print(f"\n{'metric':<14}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric in sorted(set(baseline) | set(results)):
+        before, after = baseline.get(metric), results.get(metric)
+        if before is None or after is None:
+            print(f"{metric:<14}{'-' if before is None else f'{before:.4f}':>12}"
+                  f"{'-' if after is None else f'{after:.4f}':>12}{'n/a':>10}")
+            continue
+        change = (after - before) / before if before else 0
+        print(f"{metric:<14}{before:>12.4f}{after:>12.4f}{change:>+10.1%}")
+        if after > before * (1 + args.threshold) and after - before > args.min_delta:
+            regressions.append(metric)
+
+    if regressions:
+        print(f"\n❌ Regression past {args.threshold:.0%} in: {', '.join(regressions)}")
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+
+def main():
+    args = parse_args()
+    import app as street_app
+
+    if args.command == 'record':
+        return record(args, street_app)
+    return run(args, street_app)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
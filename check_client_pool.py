@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Offline check of ClientPool routing and health tracking against stub clients.
+
+Covers weighted least-outstanding routing, marking an endpoint unhealthy after
+repeated 429s, probe recovery after the cooldown, no failover on timeouts, and
+pinning calls that use an uploaded file to the endpoint that owns it.
+No credentials needed:
+    python check_client_pool.py
+"""
+
+import sys
+import time
+import threading
+
+from google.genai import errors, types
+
+from client_pool import ClientPool, Endpoint
+
+
+class StubModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, model, contents, config=None):
+        return self._owner.handle(config)
+
+
+class StubFiles:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def upload(self, file, config=None):
+        self._owner.handle(config)
+        return types.File(name=f"files/{self._owner.name}", uri=f"https://files.example/{self._owner.name}",
+                          mime_type='application/pdf')
+
+    def get(self, name, config=None):
+        self._owner.handle(config)
+        return types.File(name=name, mime_type='application/pdf', state='ACTIVE')
+
+
+class StubClient:
+    """Fake genai.Client that sleeps for `delay` and raises `fail_with` while it is set."""
+
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.fail_with = None
+        self.calls = 0
+        self.timeouts = []
+        self.models = StubModels(self)
+        self.files = StubFiles(self)
+
+    def handle(self, config):
+        self.calls += 1
+        http_options = getattr(config, 'http_options', None)
+        if http_options is not None:
+            self.timeouts.append(http_options.timeout)
+        time.sleep(self.delay)
+        if self.fail_with is not None:
+            raise self.fail_with()
+        return types.GenerateContentResponse()
+
+
+def quota_error():
+    return errors.APIError(429, {'error': {'message': 'quota', 'status': 'RESOURCE_EXHAUSTED'}})
+
+
+def unavailable_error():
+    return errors.APIError(503, {'error': {'message': 'unavailable', 'status': 'UNAVAILABLE'}})
+
+
+class ReadTimeout(Exception):
+    """Stands in for the transport timeout the SDK raises."""
+
+
+def generate(pool, config=None, contents='hello'):
+    return pool.models.generate_content(model='stub-model', contents=contents, config=config)
+
+
+def check(results, ok, message):
+    print(f"{'✅' if ok else '❌'} {message}")
+    results.append(ok)
+
+
+def check_weighted_routing(results):
+    heavy, light = StubClient('heavy', delay=0.3), StubClient('light', delay=0.3)
+    pool = ClientPool([Endpoint('heavy', heavy, weight=2), Endpoint('light', light, weight=1)])
+    threads = []
+    for _ in range(6):
+        thread = threading.Thread(target=generate, args=(pool,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    check(results, (heavy.calls, light.calls) == (4, 2),
+          f"Weighted routing sends 2:1 of concurrent calls (heavy={heavy.calls}, light={light.calls})")
+
+
+def check_unhealthy_and_recovery(results):
+    flaky, steady = StubClient('flaky'), StubClient('steady')
+    pool = ClientPool([Endpoint('flaky', flaky, weight=10), Endpoint('steady', steady)],
+                      failure_threshold=3, cooldown=0.2, max_attempts=1)
+    flaky.fail_with = quota_error
+    for _ in range(3):
+        try:
+            generate(pool)
+        except errors.APIError:
+            pass
+    endpoint = pool.endpoints[0]
+    check(results, not endpoint.healthy, "Endpoint is unhealthy after 3 consecutive 429s")
+
+    generate(pool)
+    check(results, (flaky.calls, steady.calls) == (3, 1), "Unhealthy endpoint gets no traffic during cooldown")
+
+    time.sleep(0.25)
+    flaky.fail_with = None
+    generate(pool)
+    check(results, flaky.calls == 4 and endpoint.healthy, "A successful probe after the cooldown restores the endpoint")
+
+
+def check_failover(results):
+    first, second = StubClient('first'), StubClient('second')
+    pool = ClientPool([Endpoint('first', first, weight=10), Endpoint('second', second)])
+    first.fail_with = unavailable_error
+    config = types.GenerateContentConfig(http_options=types.HttpOptions(timeout=30000))
+    generate(pool, config)
+    check(results, second.calls == 1 and second.timeouts[0] <= 30000,
+          f"A 503 fails over within the caller's timeout (retry timeout {second.timeouts[0]} ms)")
+
+    endpoint = pool.endpoints[0]
+    failures = endpoint.consecutive_failures
+    first.fail_with, second.calls = ReadTimeout, 0
+    try:
+        generate(pool, config)
+        timed_out = False
+    except ReadTimeout:
+        timed_out = True
+    check(results, timed_out and second.calls == 0 and endpoint.consecutive_failures == failures,
+          "A timeout is raised without failover and not counted as an endpoint failure")
+
+
+def check_file_pinning(results):
+    one, two = StubClient('one'), StubClient('two')
+    pool = ClientPool([Endpoint('one', one), Endpoint('two', two, weight=10)])
+    uploaded = pool.files.upload(file='ignored.pdf')
+    owner = one if uploaded.name == 'files/one' else two
+    other = two if owner is one else one
+
+    other_calls = other.calls
+    for _ in range(3):
+        pool.files.get(name=uploaded.name)
+        part = types.Part.from_uri(file_uri=uploaded.uri, mime_type=uploaded.mime_type)
+        generate(pool, contents=[types.Content(role='user', parts=[part])])
+    check(results, other.calls == other_calls,
+          f"files.get and generate_content with the uploaded file stay on {owner.name}")
+
+
+def main():
+    results = []
+    check_weighted_routing(results)
+    check_unhealthy_and_recovery(results)
+    check_failover(results)
+    check_file_pinning(results)
+    print(f"\n--- Client Pool Check Complete: {sum(results)}/{len(results)} passed ---")
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
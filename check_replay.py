@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Offline check that calls recorded under one request deadline replay under another.
+
+The per-call HTTP timeout comes from the remaining deadline, so it differs on
+every request; the replay key must ignore it. Uses a stub model, no credentials needed:
+    python check_replay.py
+"""
+
+import io
+import sys
+import time
+import tempfile
+
+from google.genai import types
+from PIL import Image
+
+from genai_replay import ReplayClient, ReplayMiss, request_key
+
+
+class StubModels:
+    """Returns a solid colour image the size of the input, like a very dull model."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        source = Image.open(io.BytesIO(contents[0].parts[1].inline_data.data))
+        buffer = io.BytesIO()
+        Image.new('RGB', source.size, (40, 160, 90)).save(buffer, format='PNG')
+        part = types.Part(inline_data=types.Blob(data=buffer.getvalue(), mime_type='image/png'))
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role='model', parts=[part]))]
+        )
+
+
+class StubClient:
+    def __init__(self):
+        self.models = StubModels()
+        self.files = None
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (120, 120, 120)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def main():
+    import app as street_app
+
+    failures = 0
+    image_bytes = make_image()
+    contents = [types.Content(role='user', parts=[types.Part.from_text(text='check')])]
+
+    # 1. The key must not depend on the HTTP timeout
+    keys = {
+        request_key('models.generate_content', model='m', contents=contents,
+                    config=types.GenerateContentConfig(http_options=types.HttpOptions(timeout=timeout)))
+        for timeout in (1000, 59000)
+    }
+    keys.add(request_key('models.generate_content', model='m', contents=contents, config=None))
+    if len(keys) == 1:
+        print("✅ Request key ignores http_options")
+    else:
+        print(f"❌ Request key changes with http_options ({len(keys)} distinct keys)")
+        failures += 1
+
+    with tempfile.TemporaryDirectory() as corpus:
+        # 2. Record under a fresh deadline
+        stub = StubClient()
+        street_app.client = ReplayClient(stub, 'record', corpus)
+        recorded, _ = street_app.transform_image_bytes(
+            image_bytes, 'image/jpeg', 'Add bike lanes', region_mode='off', tile_mode='off',
+            deadline=street_app.Deadline('transform')
+        )
+
+        # 3. Replay under a deadline that is already partly used up, so the timeout differs
+        street_app.client = ReplayClient(None, 'replay', corpus, latency_scale=0)
+        try:
+            replayed, _ = street_app.transform_image_bytes(
+                image_bytes, 'image/jpeg', 'Add bike lanes', region_mode='off', tile_mode='off',
+                deadline=street_app.Deadline('transform', started=time.time() - 30)
+            )
+        except ReplayMiss as e:
+            print(f"❌ Replay with a different deadline missed the recording: {e}")
+            return 1
+
+        if recorded and replayed == recorded and stub.models.calls == 1:
+            print("✅ Record -> replay with a deadline returns the recorded image")
+        else:
+            print(f"❌ Replayed output differs from the recording (model calls: {stub.models.calls})")
+            failures += 1
+
+    print("\n--- Replay Check Complete ---")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
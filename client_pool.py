@@ -0,0 +1,230 @@
+"""
+Multi-region / multi-project pool of genai clients.
+
+ClientPool exposes the same `models` / `files` surface as genai.Client, so the
+rest of the app is unchanged. Each call is routed to the healthy endpoint with
+the fewest outstanding requests relative to its weight. An endpoint that
+returns FAILURE_THRESHOLD consecutive 429/5xx errors is marked unhealthy. After
+a cooldown it gets a single probe request; if the probe succeeds, the endpoint
+becomes healthy again. 429/5xx failures are retried on another endpoint while
+the caller's HTTP timeout still has time left. Timeouts are not retried and are
+not held against the endpoint: with a per-request deadline they usually mean the
+caller ran out of budget rather than the endpoint misbehaving.
+
+Uploaded files exist only in the project that received them, so files.get and
+any generate_content call whose contents reference an uploaded file URI are
+pinned to the endpoint that did the upload.
+"""
+
+import time
+import threading
+
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30
+MAX_ATTEMPTS = 2
+MIN_RETRY_SECONDS = 1.0
+
+
+def is_retryable(error):
+    """Only 429 and 5xx responses count against an endpoint and trigger failover."""
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+def http_timeout(config):
+    """The HTTP timeout in seconds set on a request config, or None."""
+    http_options = getattr(config, 'http_options', None)
+    timeout = getattr(http_options, 'timeout', None)
+    return timeout / 1000 if timeout else None
+
+
+def file_uris(contents):
+    """Yields the file URIs referenced by generate_content contents."""
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    for item in contents:
+        for part in getattr(item, 'parts', None) or [item]:
+            file_data = getattr(part, 'file_data', None)
+            if file_data is not None and file_data.file_uri:
+                yield file_data.file_uri
+
+
+class Endpoint:
+    """One client plus its routing state and statistics."""
+
+    def __init__(self, name, client, weight=1.0):
+        self.name = name
+        self.client = client
+        self.weight = max(float(weight), 0.01)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_error = None
+
+    def load(self):
+        return (self.outstanding + 1) / self.weight
+
+    def stats(self):
+        completed = self.requests - self.outstanding
+        return {
+            'name': self.name,
+            'weight': self.weight,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': round(self.errors / completed, 4) if completed else 0,
+            'avg_latency': round(self.total_latency / completed, 3) if completed else None,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error
+        }
+
+
+class _PoolModels:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def generate_content(self, **kwargs):
+        owners = [self._pool.files.owner(uri) for uri in file_uris(kwargs.get('contents'))]
+        owners = [owner for owner in owners if owner is not None]
+        endpoints = owners[:1] or None
+
+        config = kwargs.get('config')
+        timeout = http_timeout(config)
+        if timeout is None:
+            return self._pool.call(lambda client: client.models.generate_content(**kwargs), endpoints=endpoints)
+
+        # A failover attempt only gets what is left of the caller's timeout
+        expires_at = time.time() + timeout
+
+        def operation(client):
+            remaining_ms = max(int((expires_at - time.time()) * 1000), 1)
+            http_options = config.http_options.model_copy(update={'timeout': remaining_ms})
+            attempt_config = config.model_copy(update={'http_options': http_options})
+            return client.models.generate_content(**{**kwargs, 'config': attempt_config})
+
+        return self._pool.call(operation, endpoints=endpoints, expires_at=expires_at)
+
+
+class _PoolFiles:
+    def __init__(self, pool):
+        self._pool = pool
+        self._owners = {}
+
+    def owner(self, name_or_uri):
+        return self._owners.get(name_or_uri)
+
+    def upload(self, **kwargs):
+        # Uploaded files live in one project, so remember which endpoint owns each (by name and URI)
+        endpoint, result = self._pool.call(lambda client: client.files.upload(**kwargs), with_endpoint=True)
+        self._owners[result.name] = endpoint
+        if result.uri:
+            self._owners[result.uri] = endpoint
+        return result
+
+    def get(self, name, **kwargs):
+        owner = self._owners.get(name)
+        if owner is None:
+            return self._pool.call(lambda client: client.files.get(name=name, **kwargs))
+        return self._pool.call(lambda client: client.files.get(name=name, **kwargs), endpoints=[owner])
+
+
+class ClientPool:
+    """Routes genai calls across several clients by weighted least-outstanding-requests."""
+
+    def __init__(self, endpoints, failure_threshold=FAILURE_THRESHOLD,
+                 cooldown=COOLDOWN_SECONDS, max_attempts=MAX_ATTEMPTS):
+        if not endpoints:
+            raise ValueError("ClientPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.models = _PoolModels(self)
+        self.files = _PoolFiles(self)
+
+    def _acquire(self, candidates, exclude):
+        """Picks an endpoint and reserves a slot on it, or returns None."""
+        with self._lock:
+            now = time.time()
+            available = [e for e in candidates if e not in exclude]
+            choice = None
+
+            # Half-open: let one probe through to an unhealthy endpoint whose cooldown has passed
+            ready = [e for e in available if not e.healthy and not e.probing and e.retry_at <= now]
+            if ready:
+                choice = min(ready, key=lambda e: e.retry_at)
+                choice.probing = True
+            else:
+                healthy = [e for e in available if e.healthy]
+                if healthy:
+                    choice = min(healthy, key=lambda e: e.load())
+
+            if choice:
+                choice.outstanding += 1
+                choice.requests += 1
+            return choice
+
+    def _release(self, endpoint, started, error=None):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.total_latency += time.time() - started
+            endpoint.probing = False
+            if error is None:
+                endpoint.consecutive_failures = 0
+                if not endpoint.healthy:
+                    print(f"✅ Endpoint {endpoint.name} healthy again")
+                endpoint.healthy = True
+                return
+
+            endpoint.errors += 1
+            endpoint.last_error = str(error)[:200]
+            if not is_retryable(error):
+                return
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold or not endpoint.healthy:
+                if endpoint.healthy:
+                    print(f"⚠️  Endpoint {endpoint.name} marked unhealthy: {endpoint.last_error}")
+                endpoint.healthy = False
+                endpoint.retry_at = time.time() + self.cooldown
+
+    def call(self, operation, endpoints=None, with_endpoint=False, expires_at=None):
+        """
+        Runs operation(client) on the best endpoint, failing over on 429/5xx errors.
+        No failover is attempted once less than MIN_RETRY_SECONDS remain before expires_at.
+        """
+        candidates = endpoints or self.endpoints
+        tried = []
+        last_error = None
+        for _ in range(self.max_attempts):
+            if last_error is not None and expires_at is not None and expires_at - time.time() < MIN_RETRY_SECONDS:
+                break
+            endpoint = self._acquire(candidates, tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            started = time.time()
+            try:
+                result = operation(endpoint.client)
+            except Exception as e:
+                self._release(endpoint, started, e)
+                last_error = e
+                if not is_retryable(e):
+                    raise
+                continue
+            self._release(endpoint, started)
+            return (endpoint, result) if with_endpoint else result
+
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("No healthy GenAI endpoint available")
+
+    def stats(self):
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
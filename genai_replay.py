@@ -0,0 +1,214 @@
+"""
+Record/replay layer for the genai.Client calls used by app.py.
+
+Wraps models.generate_content, files.upload and files.get. In 'record' mode
+every call goes to the real client and the request/response pair is stored
+under the replay directory; in 'replay' mode responses are served from disk,
+after sleeping for the recorded latency multiplied by latency_scale.
+
+Layout of the replay directory:
+    calls/<request key>.json   recorded responses for one request (replayed in order)
+    blobs/<sha256>             image / file bytes, content-addressed
+
+The request key is a hash of the method, model, contents and config, with
+binary data replaced by its content hash and per-call HTTP options (timeouts)
+left out, so the same logical request always maps to the same recording.
+"""
+
+import os
+import json
+import time
+import enum
+import hashlib
+import threading
+
+from google.genai import types
+
+
+class ReplayMiss(KeyError):
+    """Raised in replay mode when a request has no recording."""
+
+
+class BlobStore:
+    """Content-addressed store for binary payloads."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.root, digest)
+        if not os.path.exists(path):
+            with open(path + '.tmp', "wb") as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        return digest
+
+    def get(self, digest):
+        with open(os.path.join(self.root, digest), "rb") as f:
+            return f.read()
+
+
+def _to_plain(value):
+    """Converts SDK objects to plain dicts/lists, keeping bytes as bytes."""
+    if hasattr(value, 'model_dump'):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(item) for item in value]
+    return value
+
+
+def _externalize(value, blob_handler):
+    """Replaces bytes with {'__blob__': sha256} and enums with their values."""
+    if isinstance(value, bytes):
+        return {'__blob__': blob_handler(value)}
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _externalize(item, blob_handler) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_externalize(item, blob_handler) for item in value]
+    return value
+
+
+def _internalize(value, blobs):
+    """Inverse of _externalize: loads blob references back into bytes."""
+    if isinstance(value, dict):
+        if set(value) == {'__blob__'}:
+            return blobs.get(value['__blob__'])
+        return {key: _internalize(item, blobs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_internalize(item, blobs) for item in value]
+    return value
+
+
+def request_key(method, **request):
+    """Stable hash identifying a logical request."""
+    hash_bytes = lambda data: hashlib.sha256(data).hexdigest()
+    plain = _externalize(_to_plain(request), hash_bytes)
+    if isinstance(plain.get('config'), dict):
+        plain['config'].pop('http_options', None)
+    if not plain.get('config'):
+        # A config holding only http_options is the same request as no config
+        plain.pop('config', None)
+    payload = json.dumps({'method': method, 'request': plain}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReplayStore:
+    """Reads and writes recorded calls for one replay directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.calls_dir = os.path.join(root, 'calls')
+        os.makedirs(self.calls_dir, exist_ok=True)
+        self.blobs = BlobStore(os.path.join(root, 'blobs'))
+        self._lock = threading.Lock()
+        self._cursors = {}
+
+    def _path(self, key):
+        return os.path.join(self.calls_dir, f"{key}.json")
+
+    def save(self, key, method, response, latency):
+        entry = {
+            'method': method,
+            'latency': latency,
+            'response': _externalize(_to_plain(response), self.blobs.put)
+        }
+        with self._lock:
+            entries = []
+            if os.path.exists(self._path(key)):
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            entries.append(entry)
+            with open(self._path(key), "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1)
+
+    def load(self, key, method):
+        """Returns (response_dict, latency), cycling through entries recorded for the key."""
+        with self._lock:
+            if not os.path.exists(self._path(key)):
+                raise ReplayMiss(f"No recording for {method} request {key[:12]}")
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+        entry = entries[index % len(entries)]
+        return _internalize(entry['response'], self.blobs), entry['latency']
+
+
+class _ReplayModels:
+    def __init__(self, replay):
+        self._replay = replay
+
+    def generate_content(self, model, contents, config=None):
+        return self._replay.call(
+            'models.generate_content',
+            lambda: self._replay.inner.models.generate_content(model=model, contents=contents, config=config),
+            types.GenerateContentResponse,
+            model=model, contents=contents, config=config
+        )
+
+
+class _ReplayFiles:
+    def __init__(self, replay):
+        self._replay = replay
+
+    def upload(self, file, config=None):
+        # Key uploads on the file content rather than the handle or path
+        if hasattr(file, 'read'):
+            position = file.tell()
+            content = file.read()
+            file.seek(position)
+        else:
+            with open(file, "rb") as f:
+                content = f.read()
+        return self._replay.call(
+            'files.upload',
+            lambda: self._replay.inner.files.upload(file=file, config=config),
+            types.File,
+            file=content, config=config
+        )
+
+    def get(self, name, config=None):
+        return self._replay.call(
+            'files.get',
+            lambda: self._replay.inner.files.get(name=name, config=config),
+            types.File,
+            name=name, config=config
+        )
+
+
+class ReplayClient:
+    """
+    Drop-in stand-in for genai.Client covering the calls app.py makes.
+    mode is 'record' (requires a real inner client) or 'replay' (inner may be None).
+    """
+
+    def __init__(self, inner, mode, root, latency_scale=1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        if mode == 'record' and inner is None:
+            raise ValueError("Record mode needs a real client to record from")
+        self.inner = inner
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.store = ReplayStore(root)
+        self.models = _ReplayModels(self)
+        self.files = _ReplayFiles(self)
+
+    def call(self, method, live_call, response_type, **request):
+        key = request_key(method, **request)
+        if self.mode == 'record':
+            started = time.time()
+            response = live_call()
+            self.store.save(key, method, response, time.time() - started)
+            return response
+
+        data, latency = self.store.load(key, method)
+        if latency and self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        return response_type.model_validate(data)
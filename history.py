@@ -0,0 +1,167 @@
+"""
+Transformation history store.
+
+Keeps one row per /api/transform request in an embedded SQLite database so past
+results can be found without listing static/generated. Writes are queued and
+applied by a background thread, keeping them off the request path.
+"""
+
+import json
+import queue
+import atexit
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transformations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    input_filename TEXT,
+    input_hash TEXT,
+    input_bytes INTEGER,
+    preset_key TEXT,
+    custom_prompt TEXT,
+    prompt_hash TEXT,
+    model TEXT,
+    output_path TEXT,
+    output_bytes INTEGER,
+    timings TEXT,
+    total_time REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transformations_input_hash ON transformations (input_hash);
+CREATE INDEX IF NOT EXISTS idx_transformations_preset_id ON transformations (preset_key, id);
+CREATE INDEX IF NOT EXISTS idx_transformations_prompt_hash ON transformations (prompt_hash);
+CREATE INDEX IF NOT EXISTS idx_transformations_status_id ON transformations (status, id);
+"""
+
+COLUMNS = (
+    'created_at', 'status', 'input_filename', 'input_hash', 'input_bytes', 'preset_key',
+    'custom_prompt', 'prompt_hash', 'model', 'output_path', 'output_bytes', 'timings',
+    'total_time', 'error'
+)
+
+# Columns holding user-supplied text, server paths or raw upstream errors
+PRIVATE_COLUMNS = ('input_filename', 'custom_prompt', 'output_path', 'error')
+
+# Longest time an exiting process waits for queued rows to be written
+EXIT_FLUSH_TIMEOUT = 5
+
+# Columns added after the first release, with their types, for upgrading existing databases
+ADDED_COLUMNS = {'custom_prompt': 'TEXT'}
+
+
+class HistoryStore:
+    """SQLite-backed transformation history with an asynchronous writer."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._queue = queue.Queue()
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            existing = {row['name'] for row in conn.execute("PRAGMA table_info(transformations)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE transformations ADD COLUMN {column} {column_type}")
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+        # The writer is a daemon thread, so write out queued rows before the process exits
+        atexit.register(self._flush_on_exit)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            record = self._queue.get()
+            try:
+                conn.execute(
+                    f"INSERT INTO transformations ({', '.join(COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                    [record.get(column) for column in COLUMNS]
+                )
+                conn.commit()
+            except Exception as e:
+                print(f"Error writing transformation history: {e}")
+            finally:
+                self._queue.task_done()
+
+    def record(self, **fields):
+        """Queues a history row; returns immediately."""
+        fields.setdefault('created_at', time.time())
+        if isinstance(fields.get('timings'), dict):
+            fields['timings'] = json.dumps(fields['timings'])
+        self._queue.put(fields)
+
+    def flush(self, timeout=None):
+        """
+        Blocks until every queued row has been written, or until timeout seconds pass.
+        Returns False if rows were still pending when the timeout ran out.
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _flush_on_exit(self):
+        if not self.flush(EXIT_FLUSH_TIMEOUT):
+            print(f"⚠️  Exiting with {self._queue.unfinished_tasks} transformation history rows unwritten")
+
+    def list(self, limit=20, cursor=None, preset_key=None, status=None, columns=COLUMNS):
+        """
+        Returns (rows, next_cursor) using keyset pagination on id, newest first.
+        Pass the returned next_cursor back in to fetch the following page.
+        Rows contain id plus the requested columns.
+        """
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown history columns: {', '.join(sorted(unknown))}")
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append("id < ?")
+            params.append(cursor)
+        if preset_key is not None:
+            clauses.append("preset_key = ?")
+            params.append(preset_key)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(('id',) + tuple(columns))} FROM transformations {where} ORDER BY id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        items = []
+        for row in rows[:limit]:
+            item = dict(row)
+            if 'timings' in item:
+                item['timings'] = json.loads(item['timings']) if item['timings'] else {}
+            items.append(item)
+
+        next_cursor = items[-1]['id'] if len(rows) > limit else None
+        return items, next_cursor
@@ -0,0 +1,189 @@
+"""
+Opt-in sampling profiler for production requests.
+
+A background thread samples the request thread's stack every few milliseconds,
+plus any worker threads running code wrapped with follow() on its behalf (e.g.
+the tile workers in generate_tiled_image), and writes the result in folded-stack format ("frame;frame;frame count"), which
+flamegraph.pl, speedscope and inferno read directly. Profiles are kept in a
+bounded directory; the oldest files are removed first.
+
+Profiling is enabled either by PROFILE_SAMPLE_RATE (fraction of requests) or
+per request with an X-Profile-Signature header signed with PROFILE_SECRET:
+    X-Profile-Signature: <unix timestamp>:<hex HMAC-SHA256(PROFILE_SECRET, timestamp)>
+When neither is configured the decorator is a single boolean check.
+"""
+
+import os
+import sys
+import hmac
+import time
+import random
+import uuid
+import hashlib
+import threading
+import functools
+
+from flask import request, has_request_context
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_SIGNATURE_MAX_AGE = 300
+
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_SECRET)
+
+_active = threading.local()
+_write_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of a set of threads on a timer and aggregates folded stacks."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.time() - self.started
+
+    def add_thread(self, thread_id):
+        self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id):
+        self.thread_ids.discard(thread_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def folded(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in sorted(self.stacks.items())) + '\n'
+
+
+def valid_signature(header):
+    """Checks a '<timestamp>:<hmac>' header against PROFILE_SECRET and rejects stale timestamps."""
+    if not PROFILE_SECRET or not header or ':' not in header:
+        return False
+    timestamp, signature = header.split(':', 1)
+    try:
+        if abs(time.time() - int(timestamp)) > PROFILE_SIGNATURE_MAX_AGE:
+            return False
+    except ValueError:
+        return False
+    expected = hmac.new(PROFILE_SECRET.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def follow(func):
+    """
+    Wraps func so that, when it runs on another thread, that thread is sampled by
+    the calling thread's active profiler. Returns func unchanged when not profiling.
+    """
+    profiler = getattr(_active, 'profiler', None)
+    if profiler is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        thread_id = threading.get_ident()
+        profiler.add_thread(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.remove_thread(thread_id)
+
+    return wrapper
+
+
+def should_profile():
+    if getattr(_active, 'profiler', None) is not None:
+        # Already inside a profiled call on this thread; the outer profile covers it
+        return False
+    if has_request_context() and valid_signature(request.headers.get('X-Profile-Signature')):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def write_profile(name, profiler):
+    """Writes a folded-stack profile and trims the directory to PROFILE_MAX_FILES."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{int(profiler.duration * 1000)}ms-{uuid.uuid4().hex[:8]}.folded"
+    with _write_lock:
+        with open(os.path.join(PROFILE_DIR, filename), "w", encoding="utf-8") as f:
+            f.write(profiler.folded())
+        profiles = sorted(
+            (os.path.join(PROFILE_DIR, p) for p in os.listdir(PROFILE_DIR) if p.endswith('.folded')),
+            key=os.path.getmtime
+        )
+        for old in profiles[:-PROFILE_MAX_FILES]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    print(f"Profile written: {filename} ({profiler.samples} samples)")
+
+
+def profiled(name):
+    """Decorator that profiles a sampled fraction of calls when profiling is enabled."""
+    def decorator(func):
+        if not PROFILING_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not should_profile():
+                return func(*args, **kwargs)
+
+            profiler = SamplingProfiler(threading.get_ident())
+            _active.profiler = profiler
+            profiler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.stop()
+                _active.profiler = None
+                try:
+                    write_profile(name, profiler)
+                except Exception as e:
+                    print(f"Error writing profile: {e}")
+
+        return wrapper
+    return decorator
+
+
+def list_profiles(limit=50):
+    """Returns metadata for the most recent profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in os.listdir(PROFILE_DIR):
+        if not filename.endswith('.folded'):
+            continue
+        stat = os.stat(os.path.join(PROFILE_DIR, filename))
+        profiles.append({'name': filename, 'bytes': stat.st_size, 'created_at': stat.st_mtime})
+    profiles.sort(key=lambda p: p['created_at'], reverse=True)
+    return profiles[:limit]
@@ -0,0 +1,33 @@
+// Decodes, downscales and re-encodes an image off the main thread.
+// Message in:  { file, maxEdge, keepOriginalAbove, format, fallbackFormat, quality }
+// Message out: { blob }, { original: true } when the file should be sent as is, or { error }
+self.addEventListener('message', async (e) => {
+    const { file, maxEdge, keepOriginalAbove, format, fallbackFormat, quality } = e.data;
+    try {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        // The server tiles images this large at full resolution, so don't shrink them
+        if (keepOriginalAbove > 0 && Math.max(bitmap.width, bitmap.height) > keepOriginalAbove) {
+            bitmap.close();
+            self.postMessage({ original: true });
+            return;
+        }
+        const scale = maxEdge > 0 ? Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height)) : 1;
+        const width = Math.round(bitmap.width * scale);
+        const height = Math.round(bitmap.height * scale);
+
+        const canvas = new OffscreenCanvas(width, height);
+        const ctx = canvas.getContext('2d');
+        ctx.imageSmoothingQuality = 'high';
+        ctx.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+
+        let blob = await canvas.convertToBlob({ type: format, quality });
+        // Browsers without an encoder for the requested type silently return PNG
+        if (blob.type !== format) {
+            blob = await canvas.convertToBlob({ type: fallbackFormat, quality });
+        }
+        self.postMessage({ blob });
+    } catch (error) {
+        self.postMessage({ error: error.message });
+    }
+});
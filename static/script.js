@@ -13,10 +13,26 @@ document.addEventListener('DOMContentLoaded', () => {
     const resultImage = document.getElementById('result-image');
     const closeResultBtn = document.getElementById('close-result');
     const loadingOverlay = document.getElementById('loading-overlay');
+    const loadingText = document.getElementById('loading-text');
+    const defaultLoadingText = loadingText.textContent;
+    const resizeWorkerUrl = document.body.dataset.resizeWorkerUrl || '/static/resize-worker.js';
 
     let selectedFile = null;
     let selectedPrompt = '';
 
+    // Server-provided budget for /api/transform (slightly above the server's own deadline)
+    let requestTimeoutMs = parseInt(document.body.dataset.requestTimeoutMs, 10) || 130000;
+
+    // Upload limits published by the server; until they load we send the original file
+    let uploadConfig = { max_edge: 0 };
+    fetch('/api/config')
+        .then(response => response.json())
+        .then(config => {
+            uploadConfig = config.upload || uploadConfig;
+            requestTimeoutMs = config.request_timeout_ms || requestTimeoutMs;
+        })
+        .catch(error => console.warn('Could not load upload config:', error));
+
     // Drag & Drop
     dropZone.addEventListener('dragover', (e) => {
         e.preventDefault();
@@ -56,19 +72,18 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
         selectedFile = file;
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            imagePreview.src = e.target.result;
-            uploadContent.classList.add('hidden');
-            previewContainer.classList.remove('hidden');
-            updateGenerateState();
-        };
-        reader.readAsDataURL(file);
+        // An object URL lets the browser decode the preview lazily instead of base64-copying the file
+        if (imagePreview.src.startsWith('blob:')) URL.revokeObjectURL(imagePreview.src);
+        imagePreview.src = URL.createObjectURL(file);
+        uploadContent.classList.add('hidden');
+        previewContainer.classList.remove('hidden');
+        updateGenerateState();
     }
 
     function resetFile() {
         selectedFile = null;
         fileInput.value = '';
+        if (imagePreview.src.startsWith('blob:')) URL.revokeObjectURL(imagePreview.src);
         imagePreview.src = '';
         uploadContent.classList.remove('hidden');
         previewContainer.classList.add('hidden');
@@ -109,6 +124,94 @@ document.addEventListener('DOMContentLoaded', () => {
         generateBtn.disabled = !(hasFile && hasPrompt);
     }
 
+    // Client-side downscaling and compression
+    function resizeInWorker(file, options) {
+        return new Promise((resolve, reject) => {
+            const worker = new Worker(resizeWorkerUrl);
+            worker.onmessage = (e) => {
+                worker.terminate();
+                e.data.error ? reject(new Error(e.data.error)) : resolve(e.data.original ? null : e.data.blob);
+            };
+            worker.onerror = (e) => {
+                worker.terminate();
+                reject(new Error(e.message));
+            };
+            worker.postMessage({ file, ...options });
+        });
+    }
+
+    async function resizeOnMainThread(file, options) {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        if (options.keepOriginalAbove > 0 && Math.max(bitmap.width, bitmap.height) > options.keepOriginalAbove) {
+            bitmap.close();
+            return null;
+        }
+        const scale = options.maxEdge > 0 ? Math.min(1, options.maxEdge / Math.max(bitmap.width, bitmap.height)) : 1;
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+
+        const toBlob = (type) => new Promise(resolve => canvas.toBlob(resolve, type, options.quality));
+        let blob = await toBlob(options.format);
+        if (!blob || blob.type !== options.format) {
+            blob = await toBlob(options.fallbackFormat);
+        }
+        return blob;
+    }
+
+    async function prepareUpload(file) {
+        if (!uploadConfig.max_edge) return file;
+
+        const options = {
+            maxEdge: uploadConfig.max_edge,
+            keepOriginalAbove: uploadConfig.keep_original_above || 0,
+            format: uploadConfig.format,
+            fallbackFormat: uploadConfig.fallback_format,
+            quality: uploadConfig.quality
+        };
+        let blob;
+        try {
+            blob = (typeof OffscreenCanvas !== 'undefined' && typeof Worker !== 'undefined')
+                ? await resizeInWorker(file, options)
+                : await resizeOnMainThread(file, options);
+        } catch (error) {
+            console.warn('Client-side resize failed, uploading original:', error);
+            return file;
+        }
+
+        // Keep the original if it will be tiled server-side (null) or re-encoding didn't help (e.g. an already small JPEG)
+        if (!blob || blob.size >= file.size) return file;
+
+        const extension = blob.type === 'image/webp' ? '.webp' : blob.type === 'image/png' ? '.png' : '.jpg';
+        const name = file.name.replace(/\.[^.]+$/, '') + extension;
+        console.log(`Upload compressed: ${file.size} -> ${blob.size} bytes`);
+        return new File([blob], name, { type: blob.type });
+    }
+
+    // XHR instead of fetch so we can report upload progress
+    function postWithProgress(url, formData, onProgress) {
+        return new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            xhr.open('POST', url);
+            xhr.timeout = requestTimeoutMs;
+            xhr.responseType = 'json';
+            xhr.upload.onprogress = (e) => {
+                if (e.lengthComputable) onProgress(e.loaded / e.total);
+            };
+            xhr.upload.onload = () => onProgress(1);
+            xhr.onload = () => resolve(xhr.response || { error: `Server returned ${xhr.status}` });
+            xhr.onerror = () => reject(new Error('Network error'));
+            xhr.ontimeout = () => {
+                const error = new Error('Request timed out');
+                error.name = 'TimeoutError';
+                reject(error);
+            };
+            xhr.send(formData);
+        });
+    }
+
     // Generate Action
     generateBtn.addEventListener('click', async () => {
         if (!selectedFile) return;
@@ -120,20 +223,22 @@ document.addEventListener('DOMContentLoaded', () => {
         resultSection.classList.remove('hidden');
         loadingOverlay.classList.remove('hidden');
         resultImage.classList.add('hidden');
-
-        // Prepare Form Data
-        const formData = new FormData();
-        formData.append('image', selectedFile);
-        formData.append('prompt_type', selectedPrompt ? 'preset' : 'custom');
-        formData.append('custom_prompt', effectivePrompt);
+        loadingText.textContent = 'Preparing image...';
 
         try {
-            const response = await fetch('/api/transform', {
-                method: 'POST',
-                body: formData
-            });
+            const uploadFile = await prepareUpload(selectedFile);
 
-            const data = await response.json();
+            // Prepare Form Data
+            const formData = new FormData();
+            formData.append('image', uploadFile);
+            formData.append('prompt_type', selectedPrompt ? 'preset' : 'custom');
+            formData.append('custom_prompt', effectivePrompt);
+
+            const data = await postWithProgress('/api/transform', formData, (fraction) => {
+                loadingText.textContent = fraction < 1
+                    ? `Uploading... ${Math.round(fraction * 100)}%`
+                    : defaultLoadingText;
+            });
 
             // Handle backend response
             if (data.status === 'success' && data.image_url) {
@@ -149,7 +254,11 @@ document.addEventListener('DOMContentLoaded', () => {
 
         } catch (error) {
             console.error('Error:', error);
-            alert('Generation failed: ' + error.message);
+            if (error.name === 'TimeoutError') {
+                alert('Generation timed out. Please try again.');
+            } else {
+                alert('Generation failed: ' + error.message);
+            }
             resultSection.classList.add('hidden');
         }
     });